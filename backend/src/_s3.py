@@ -0,0 +1,28 @@
+"""
+Shared S3 client for Polar Builder API
+One tuned client serves every module so TLS sessions and pooled sockets
+are reused instead of each importer paying for its own client
+"""
+
+import os
+import boto3
+from botocore.config import Config
+
+REGION = os.environ.get('AWS_REGION', 'us-east-1')
+
+S3 = boto3.client(
+    's3',
+    region_name=REGION,
+    aws_access_key_id=os.environ.get('AWS_ACCESS_KEY_ID'),
+    aws_secret_access_key=os.environ.get('AWS_SECRET_ACCESS_KEY'),
+    # Adaptive retry mode handles transient 5xx/SlowDown responses inside
+    # the SDK with exponential backoff and client-side rate limiting, so
+    # callers never need application-level retries for throttling
+    config=Config(
+        max_pool_connections=64,
+        retries={'mode': 'adaptive', 'max_attempts': 10},
+        tcp_keepalive=True,
+        connect_timeout=3,
+        read_timeout=30
+    )
+)
@@ -3,35 +3,60 @@ Cloud Storage Module for Polar Builder API
 Provides S3-compatible cloud storage functionality for file operations
 """
 
-import boto3
 import os
 import io
+import time
 import logging
-from botocore.exceptions import ClientError, NoCredentialsError
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from typing import Optional, BinaryIO
 
+try:
+    from src._s3 import S3 as shared_s3_client
+except ImportError:  # running outside the src package
+    from _s3 import S3 as shared_s3_client
+
 logger = logging.getLogger(__name__)
 
+def _error_code(e: ClientError) -> str:
+    """Extract the service error code from a ClientError
+
+    Transient 5xx/SlowDown responses are retried inside the SDK (adaptive
+    retry mode on the shared client), so anything surfacing here has
+    either exhausted its retries or is a plain 4xx; the code makes the
+    difference visible to operators.
+    """
+    return e.response.get('Error', {}).get('Code', 'Unknown')
+
+# How long a listed prefix stays valid for existence checks (seconds)
+EXISTS_CACHE_TTL = 5.0
+
+# Objects above this size are fetched with parallel ranged GETs; a single
+# S3 connection tops out around 90 MiB/s, so large downloads benefit from
+# multiple connections pulling separate byte ranges
+RANGED_GET_THRESHOLD = 16 * 1024 * 1024
+RANGED_GET_PART_SIZE = 8 * 1024 * 1024
+RANGED_GET_WORKERS = 8
+
 class CloudStorage:
     """S3-compatible cloud storage handler"""
-    
+
     def __init__(self):
         """Initialize cloud storage client"""
         self.bucket_name = os.getenv('S3_BUCKET_NAME', 'polar-builder-files')
         self.region = os.getenv('AWS_REGION', 'us-east-1')
+        # Cache of prefix -> (set of keys under prefix, monotonic timestamp)
+        self._exists_cache: dict = {}
+        # Presigned URLs are valid for their full expiration window, so
+        # re-signing identical requests just burns CPU on HMAC work; cache
+        # per (key, expiration, time bucket) so a URL is reused while at
+        # least half its TTL remains
+        self._sign_cached = lru_cache(maxsize=4096)(self._sign)
         
-        # Initialize S3 client
-        try:
-            self.s3_client = boto3.client(
-                's3',
-                region_name=self.region,
-                aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-                aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
-            )
-            logger.info(f"Cloud storage initialized for bucket: {self.bucket_name}")
-        except NoCredentialsError:
-            logger.error("AWS credentials not found")
-            self.s3_client = None
+        # All modules share one tuned client so pooled sockets are reused
+        self.s3_client = shared_s3_client
+        logger.info(f"Cloud storage initialized for bucket: {self.bucket_name}")
     
     def upload_file(self, file_data: BinaryIO, key: str, content_type: str = 'application/octet-stream') -> bool:
         """
@@ -63,46 +88,131 @@ class CloudStorage:
             return True
             
         except ClientError as e:
-            logger.error(f"Failed to upload file {key}: {e}")
+            logger.error(f"Failed to upload file {key}: {_error_code(e)}: {e}")
             return False
     
     def download_file(self, key: str) -> Optional[bytes]:
         """
         Download file from cloud storage
-        
+
+        Large objects are fetched with concurrent ranged GETs so the
+        transfer isn't capped by a single connection's bandwidth.
+
         Args:
             key: Storage key/path of the file
-            
+
         Returns:
             bytes: File content if successful, None otherwise
         """
         if not self.s3_client:
             logger.error("S3 client not initialized")
             return None
-            
+
         try:
-            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=key)
-            content = response['Body'].read()
+            head = self.s3_client.head_object(Bucket=self.bucket_name, Key=key)
+            size = head['ContentLength']
+
+            if size > RANGED_GET_THRESHOLD:
+                content = self._download_ranged(key, size)
+            else:
+                response = self.s3_client.get_object(Bucket=self.bucket_name, Key=key)
+                content = response['Body'].read()
+
             logger.info(f"Successfully downloaded file: {key}")
             return content
-            
+
         except ClientError as e:
-            logger.error(f"Failed to download file {key}: {e}")
+            logger.error(f"Failed to download file {key}: {_error_code(e)}: {e}")
             return None
+
+    def _download_ranged(self, key: str, size: int) -> bytes:
+        """
+        Download a large object with parallel byte-range requests
+
+        Args:
+            key: Storage key/path of the file
+            size: Object size from a prior HEAD request
+
+        Returns:
+            bytes: Assembled file content
+        """
+        buf = bytearray(size)
+
+        def fetch_range(lo, hi):
+            response = self.s3_client.get_object(
+                Bucket=self.bucket_name,
+                Key=key,
+                Range=f'bytes={lo}-{hi}'
+            )
+            buf[lo:hi + 1] = response['Body'].read()
+
+        ranges = [(lo, min(lo + RANGED_GET_PART_SIZE, size) - 1)
+                  for lo in range(0, size, RANGED_GET_PART_SIZE)]
+
+        # The low-level client is thread-safe, so all workers share it
+        with ThreadPoolExecutor(max_workers=RANGED_GET_WORKERS) as pool:
+            for future in [pool.submit(fetch_range, lo, hi) for lo, hi in ranges]:
+                future.result()
+
+        return bytes(buf)
     
+    def open_stream(self, key: str):
+        """
+        Open a file as a streaming body without buffering it in memory
+
+        Returns the underlying botocore StreamingBody so callers consume
+        bytes as they arrive from the socket instead of holding two full
+        copies of the object in RAM.
+
+        Args:
+            key: Storage key/path of the file
+
+        Returns:
+            StreamingBody: Readable stream if successful, None otherwise
+        """
+        if not self.s3_client:
+            logger.error("S3 client not initialized")
+            return None
+
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=key)
+            return response['Body']
+
+        except ClientError as e:
+            logger.error(f"Failed to open stream for file {key}: {_error_code(e)}: {e}")
+            return None
+
+    def iter_file(self, key: str, chunk_size: int = 1024 * 1024):
+        """
+        Iterate over a file's content in chunks
+
+        Args:
+            key: Storage key/path of the file
+            chunk_size: Size of each chunk in bytes (default: 1 MiB)
+
+        Returns:
+            generator: Yields chunks of file content
+        """
+        body = self.open_stream(key)
+        if body is not None:
+            yield from body.iter_chunks(chunk_size)
+
     def download_file_stream(self, key: str) -> Optional[io.BytesIO]:
         """
-        Download file as stream from cloud storage
-        
+        Download file as an in-memory stream from cloud storage
+
+        Deprecated: prefer open_stream, which avoids buffering the whole
+        object; this remains for callers that need a seekable stream.
+
         Args:
             key: Storage key/path of the file
-            
+
         Returns:
             io.BytesIO: File stream if successful, None otherwise
         """
-        content = self.download_file(key)
-        if content:
-            return io.BytesIO(content)
+        body = self.open_stream(key)
+        if body is not None:
+            return io.BytesIO(body.read())
         return None
     
     def delete_file(self, key: str) -> bool:
@@ -125,86 +235,170 @@ class CloudStorage:
             return True
             
         except ClientError as e:
-            logger.error(f"Failed to delete file {key}: {e}")
+            logger.error(f"Failed to delete file {key}: {_error_code(e)}: {e}")
             return False
     
+    def _list_prefix(self, prefix: str) -> set:
+        """
+        List all keys under a prefix, caching the result for a short TTL
+
+        Args:
+            prefix: Key prefix to list
+
+        Returns:
+            set: All keys currently stored under the prefix
+        """
+        cached = self._exists_cache.get(prefix)
+        if cached and time.monotonic() - cached[1] < EXISTS_CACHE_TTL:
+            return cached[0]
+
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        pages = paginator.paginate(Bucket=self.bucket_name, Prefix=prefix)
+        keys = set(obj['Key'] for page in pages for obj in page.get('Contents', []))
+        self._exists_cache[prefix] = (keys, time.monotonic())
+        return keys
+
+    def files_exist(self, prefix: str, keys: list) -> dict:
+        """
+        Check existence of multiple files under a common prefix with one LIST
+
+        Much cheaper than per-key HEAD requests when probing many keys
+        under the same prefix (e.g. boats/<id>/logs/).
+
+        Args:
+            prefix: Common key prefix for all keys being checked
+            keys: Storage keys to check
+
+        Returns:
+            dict: Mapping of key -> bool existence
+        """
+        if not self.s3_client:
+            logger.error("S3 client not initialized")
+            return {key: False for key in keys}
+
+        try:
+            existing = self._list_prefix(prefix)
+            return {key: key in existing for key in keys}
+        except ClientError as e:
+            logger.error(f"Failed to check files under prefix {prefix}: {_error_code(e)}: {e}")
+            return {key: False for key in keys}
+
     def file_exists(self, key: str) -> bool:
         """
         Check if file exists in cloud storage
-        
+
+        Uses the cached prefix listing when available so repeated checks
+        under the same prefix cost a single LIST instead of N HEAD calls.
+
         Args:
             key: Storage key/path of the file
-            
+
         Returns:
             bool: True if file exists, False otherwise
         """
         if not self.s3_client:
             logger.error("S3 client not initialized")
             return False
-            
+
+        prefix = key.rsplit('/', 1)[0] + '/' if '/' in key else ''
+        cached = self._exists_cache.get(prefix)
+        if cached and time.monotonic() - cached[1] < EXISTS_CACHE_TTL:
+            return key in cached[0]
+
         try:
+            if prefix:
+                return key in self._list_prefix(prefix)
+            # Isolated key with no usable prefix: fall back to a single HEAD
             self.s3_client.head_object(Bucket=self.bucket_name, Key=key)
             return True
         except ClientError:
             return False
     
-    def list_files(self, prefix: str = '') -> list:
+    def list_files(self, prefix: str = '', start_after: str = None, max_keys: int = None):
         """
         List files in cloud storage with optional prefix
-        
+
+        Pages through the bucket with the ListObjectsV2 paginator instead of
+        a single call (which silently truncates at 1000 keys), and yields
+        keys lazily so callers can short-circuit.
+
         Args:
             prefix: Optional prefix to filter files
-            
+            start_after: Optional key to resume listing after
+            max_keys: Optional cap on the total number of keys returned
+
         Returns:
-            list: List of file keys
+            generator: Yields file keys in lexicographic order
         """
         if not self.s3_client:
             logger.error("S3 client not initialized")
-            return []
-            
+            return
+
         try:
-            response = self.s3_client.list_objects_v2(
-                Bucket=self.bucket_name,
-                Prefix=prefix
-            )
-            
-            files = []
-            if 'Contents' in response:
-                files = [obj['Key'] for obj in response['Contents']]
-            
-            logger.info(f"Listed {len(files)} files with prefix: {prefix}")
-            return files
-            
+            paginator = self.s3_client.get_paginator('list_objects_v2')
+            paginate_kwargs = {
+                'Bucket': self.bucket_name,
+                'Prefix': prefix,
+                'PaginationConfig': {'PageSize': 1000}
+            }
+            if start_after:
+                paginate_kwargs['StartAfter'] = start_after
+            if max_keys:
+                paginate_kwargs['PaginationConfig']['MaxItems'] = max_keys
+
+            pages = paginator.paginate(**paginate_kwargs)
+            # JMESPath projection yields only the keys, skipping the
+            # per-object metadata dicts we never read
+            for key in pages.search('Contents[].Key'):
+                if key is not None:
+                    yield key
+
         except ClientError as e:
-            logger.error(f"Failed to list files with prefix {prefix}: {e}")
-            return []
+            logger.error(f"Failed to list files with prefix {prefix}: {_error_code(e)}: {e}")
     
+    def _sign(self, key: str, expiration: int, epoch_bucket: int) -> str:
+        """
+        Generate a presigned URL; epoch_bucket keys the cache interval
+
+        Args:
+            key: Storage key/path of the file
+            expiration: URL expiration time in seconds
+            epoch_bucket: Current time divided by half the expiration, so
+                cached URLs are refreshed before they can expire
+
+        Returns:
+            str: Presigned URL
+        """
+        return self.s3_client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.bucket_name, 'Key': key},
+            ExpiresIn=expiration
+        )
+
     def get_file_url(self, key: str, expiration: int = 3600) -> Optional[str]:
         """
         Generate presigned URL for file access
-        
+
+        URLs are cached and reused while at least half their expiration
+        window remains, avoiding a full signing pass per call.
+
         Args:
             key: Storage key/path of the file
             expiration: URL expiration time in seconds (default: 1 hour)
-            
+
         Returns:
             str: Presigned URL if successful, None otherwise
         """
         if not self.s3_client:
             logger.error("S3 client not initialized")
             return None
-            
+
         try:
-            url = self.s3_client.generate_presigned_url(
-                'get_object',
-                Params={'Bucket': self.bucket_name, 'Key': key},
-                ExpiresIn=expiration
-            )
-            logger.info(f"Generated presigned URL for: {key}")
-            return url
-            
+            epoch_bucket = int(time.time()) // max(1, expiration // 2)
+            return self._sign_cached(key, expiration, epoch_bucket)
+
         except ClientError as e:
-            logger.error(f"Failed to generate URL for {key}: {e}")
+            logger.error(f"Failed to generate URL for {key}: {_error_code(e)}: {e}")
             return None
 
 # Global cloud storage instance
@@ -1,52 +1,186 @@
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
+from werkzeug.security import check_password_hash
+import base64
+import bcrypt
+import hashlib
+import hmac
 import jwt
+import orjson
 import os
+import queue
+import threading
+import time
 
 db = SQLAlchemy()
 
+# Token signing secret, read once at import: the environment never
+# changes after boot, and re-reading it per token added an env lookup
+# and a fresh HMAC key schedule to every request. This is the only
+# place the secret is read — keep it that way so secret handling stays
+# auditable in one spot.
+_SECRET = os.environ.get('SECRET_KEY', 'default-secret')
+_SECRET_BYTES = _SECRET.encode('utf-8')
+
+_TOKEN_TTL_SECONDS = 86400  # 24 hours
+
+def _b64url_decode(data):
+    """base64url-decode a JWT segment, restoring stripped padding"""
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+# Explicit bcrypt cost: ~80 ms per hash on current x86, versus several
+# hundred ms for werkzeug's pbkdf2 default, while staying brute-force
+# resistant
+BCRYPT_ROUNDS = 10
+
+# Passwords are pre-hashed with SHA-256 before bcrypt (the bcrypt-sha256
+# scheme): bcrypt silently truncates input at 72 bytes, and the SHA-256
+# step is effectively free next to bcrypt's key schedule while
+# preserving full entropy of long passphrases. The base64 wrap keeps NUL
+# bytes out of the digest handed to bcrypt.
+_BCRYPT_SHA256_PREFIX = '$bcrypt-sha256$'
+
+def _prehash(password):
+    """SHA-256 + base64 prefilter applied before bcrypt"""
+    return base64.b64encode(hashlib.sha256(password.encode('utf-8')).digest())
+
+# Salts are pre-generated off the request path: bcrypt.gensalt reads
+# /dev/urandom, and under signup bursts those syscalls serialize. A
+# daemon thread keeps a small pool topped up; set_password pops from it
+# and only falls back to a synchronous gensalt if the pool runs dry.
+_SALT_POOL_SIZE = 128
+_SALT_POOL = queue.SimpleQueue()
+_SALT_REFILL = threading.Event()
+
+def _fill_salt_pool():
+    while True:
+        while _SALT_POOL.qsize() < _SALT_POOL_SIZE:
+            _SALT_POOL.put(bcrypt.gensalt(rounds=BCRYPT_ROUNDS))
+        _SALT_REFILL.clear()
+        _SALT_REFILL.wait()
+
+def _next_salt():
+    """Pop a pre-generated salt, falling back to gensalt when empty"""
+    try:
+        salt = _SALT_POOL.get_nowait()
+    except queue.Empty:
+        salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
+    _SALT_REFILL.set()
+    return salt
+
+threading.Thread(target=_fill_salt_pool, daemon=True).start()
+
+# Verification cache in front of the slow hashers: repeat logins with the
+# same credentials skip the ~80 ms bcrypt pass and cost one SHA-256 plus a
+# dict lookup. Keys are SHA256(password + pepper + stored_hash), so no
+# plaintext is retained, entries are useless outside this process (the
+# pepper is random per boot), and changing a password self-invalidates
+# because the stored hash is part of the key.
+_VERIFY_PEPPER = os.urandom(32)
+_VERIFY_CACHE_SIZE = 4096
+_verify_cache = {}
+
+def _cached_verify(password, stored_hash, verify):
+    """Run verify(), memoizing the result keyed on a peppered digest"""
+    key = hashlib.sha256(
+        password.encode('utf-8') + _VERIFY_PEPPER + stored_hash.encode('utf-8')
+    ).digest()
+    cached = _verify_cache.get(key)
+    if cached is not None:
+        return cached
+    result = verify()
+    if len(_verify_cache) >= _VERIFY_CACHE_SIZE:
+        # dicts iterate in insertion order, so this evicts the oldest entry
+        _verify_cache.pop(next(iter(_verify_cache)))
+    _verify_cache[key] = result
+    return result
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(255), nullable=False)
     name = db.Column(db.String(100), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, server_default=db.func.now())
     last_login = db.Column(db.DateTime)
     
     # Relationships
-    boats = db.relationship('Boat', backref='owner', lazy=True, cascade='all, delete-orphan')
+    # lazy='raise' turns any accidental lazy collection fetch into an
+    # error at dev time; paths that really need the children (e.g. the
+    # delete-orphan cascade) must load them explicitly with selectinload
+    boats = db.relationship('Boat', backref='owner', lazy='raise', cascade='all, delete-orphan')
 
     def __repr__(self):
         return f'<User {self.username}>'
 
     def set_password(self, password):
-        """Set password hash"""
-        self.password_hash = generate_password_hash(password)
+        """Set password hash (bcrypt-sha256 with explicit cost)"""
+        self.password_hash = _BCRYPT_SHA256_PREFIX + bcrypt.hashpw(
+            _prehash(password),
+            _next_salt()
+        ).decode('utf-8')
+        # We just proved password <-> hash, so prime the verification
+        # cache: the follow-up check (login after a password change)
+        # skips its first full bcrypt run
+        _cached_verify(password, self.password_hash, lambda: True)
 
     def check_password(self, password):
-        """Check password against hash"""
-        return check_password_hash(self.password_hash, password)
+        """Check password against hash
+
+        Older hashes still verify: plain bcrypt ($2...) from the first
+        bcrypt rollout, and werkzeug's method:salt$hash format before
+        that. The login route rehashes both on the next successful
+        login.
+        """
+        if self.password_hash.startswith(_BCRYPT_SHA256_PREFIX):
+            stored = self.password_hash[len(_BCRYPT_SHA256_PREFIX):]
+            return _cached_verify(
+                password, self.password_hash,
+                lambda: bcrypt.checkpw(_prehash(password), stored.encode('utf-8')))
+        if self.password_hash.startswith('$2'):
+            return _cached_verify(
+                password, self.password_hash,
+                lambda: bcrypt.checkpw(password.encode('utf-8'),
+                                       self.password_hash.encode('utf-8')))
+        return _cached_verify(
+            password, self.password_hash,
+            lambda: check_password_hash(self.password_hash, password))
+
+    def needs_rehash(self):
+        """True when the stored hash predates the bcrypt-sha256 scheme"""
+        return not self.password_hash.startswith(_BCRYPT_SHA256_PREFIX)
 
     def generate_token(self):
         """Generate JWT token for authentication"""
         payload = {
             'user_id': self.id,
             'username': self.username,
-            'exp': datetime.utcnow().timestamp() + 86400  # 24 hours
+            # time.time() instead of datetime.utcnow().timestamp():
+            # same epoch value without two datetime allocations
+            'exp': int(time.time()) + _TOKEN_TTL_SECONDS
         }
-        return jwt.encode(payload, os.environ.get('SECRET_KEY', 'default-secret'), algorithm='HS256')
+        return jwt.encode(payload, _SECRET, algorithm='HS256')
 
     @staticmethod
     def verify_token(token):
-        """Verify JWT token and return user"""
+        """Verify JWT token and return user
+
+        Runs on every authenticated request, so the HS256 check is done
+        directly with hashlib/hmac (OpenSSL's SHA-256 under the hood)
+        and orjson instead of PyJWT's full decode pipeline. Tokens stay
+        wire-compatible with jwt.encode above; anything malformed,
+        tampered with or expired yields None exactly as before.
+        """
         try:
-            payload = jwt.decode(token, os.environ.get('SECRET_KEY', 'default-secret'), algorithms=['HS256'])
-            return User.query.get(payload['user_id'])
-        except jwt.ExpiredSignatureError:
-            return None
-        except jwt.InvalidTokenError:
+            signing_input, _, sig_b64 = token.rpartition('.')
+            expected = hmac.new(_SECRET_BYTES, signing_input.encode('ascii'),
+                                hashlib.sha256).digest()
+            if not hmac.compare_digest(expected, _b64url_decode(sig_b64)):
+                return None
+            payload = orjson.loads(_b64url_decode(signing_input.split('.', 1)[1]))
+            if payload.get('exp', 0) < time.time():
+                return None
+            return db.session.get(User, payload['user_id'])
+        except Exception:
             return None
 
     def to_dict(self):
@@ -57,12 +191,12 @@ class User(db.Model):
             'name': self.name,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'last_login': self.last_login.isoformat() if self.last_login else None,
-            'boat_count': len(self.boats)
+            'boat_count': self.boat_count
         }
 
 class Boat(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     name = db.Column(db.String(100), nullable=False)
     boat_type = db.Column(db.String(50), nullable=False)  # monohull, catamaran, trimaran
     class_name = db.Column(db.String(100))
@@ -88,12 +222,12 @@ class Boat(db.Model):
     
     # Metadata
     notes = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = db.Column(db.DateTime, server_default=db.func.now())
+    updated_at = db.Column(db.DateTime, server_default=db.func.now(), onupdate=db.func.now())
     
     # Relationships
-    log_files = db.relationship('LogFile', backref='boat', lazy=True, cascade='all, delete-orphan')
-    polars = db.relationship('Polar', backref='boat', lazy=True, cascade='all, delete-orphan')
+    log_files = db.relationship('LogFile', backref='boat', lazy='raise', cascade='all, delete-orphan')
+    polars = db.relationship('Polar', backref='boat', lazy='raise', cascade='all, delete-orphan')
 
     def __repr__(self):
         return f'<Boat {self.name}>'
@@ -121,8 +255,8 @@ class Boat(db.Model):
             'notes': self.notes,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'log_file_count': len(self.log_files),
-            'polar_count': len(self.polars)
+            'log_file_count': self.log_file_count,
+            'polar_count': self.polar_count
         }
 
 class LogFile(db.Model):
@@ -149,9 +283,18 @@ class LogFile(db.Model):
     
     # Metadata
     session_notes = db.Column(db.Text)
-    upload_date = db.Column(db.DateTime, default=datetime.utcnow)
+    upload_date = db.Column(db.DateTime, server_default=db.func.now())
     processed_date = db.Column(db.DateTime)
 
+    # The file listings all run filter(boat_id) + ORDER BY upload_date
+    # DESC; this index matches that shape exactly, so newest-first lists
+    # read straight off the index instead of sorting the boat's rows on
+    # every request. Its boat_id prefix also covers the plain FK lookups
+    # that the old single-column index served.
+    __table_args__ = (
+        db.Index('ix_logfile_boat_upload', boat_id, upload_date.desc()),
+    )
+
     def __repr__(self):
         return f'<LogFile {self.filename}>'
 
@@ -181,12 +324,19 @@ class Polar(db.Model):
     name = db.Column(db.String(100))
     
     # Polar Data
-    polar_data = db.Column(db.Text)  # Store the actual polar content
-    data_summary = db.Column(db.Text)  # Store summary information
+    # Deferred: the polar text can run to megabytes, and most queries
+    # (listings, stats, version lookups) never touch it. Paths that do
+    # serialize it opt back in with undefer so it still arrives in the
+    # same roundtrip as the row.
+    polar_data = db.deferred(db.Column(db.Text))  # Store the actual polar content
+    # JSON column: the driver returns a dict directly, so list endpoints
+    # stop re-parsing the same summary text on every request. Legacy
+    # rows hold JSON text and deserialize the same way.
+    data_summary = db.Column(db.JSON)
     file_url = db.Column(db.String(500))  # Cloud storage URL
     
     # Generation info
-    generation_date = db.Column(db.DateTime, default=datetime.utcnow)
+    generation_date = db.Column(db.DateTime, server_default=db.func.now())
     
     # Statistics
     total_data_points = db.Column(db.Integer)
@@ -200,10 +350,23 @@ class Polar(db.Model):
     angle_coverage = db.Column(db.String(100))
     
     # Metadata
-    generated_date = db.Column(db.DateTime, default=datetime.utcnow)
+    generated_date = db.Column(db.DateTime, server_default=db.func.now())
     is_current = db.Column(db.Boolean, default=True)
     notes = db.Column(db.Text)
 
+    # ix_polar_boat_current drives the "current polar for boat" lookup;
+    # ix_polar_boat_gendate does the same for the newest-first polar
+    # listing and latest-polar download, and either boat_id prefix serves
+    # plain per-boat filters. The unique constraint makes concurrent
+    # generations that race to the same version fail loudly instead of
+    # silently colliding, and its index already answers ORDER BY version
+    # DESC, so no separate (boat_id, version) index is needed.
+    __table_args__ = (
+        db.Index('ix_polar_boat_current', boat_id, is_current),
+        db.Index('ix_polar_boat_gendate', boat_id, generation_date.desc()),
+        db.UniqueConstraint(boat_id, version, name='uq_polar_boat_version'),
+    )
+
     def __repr__(self):
         return f'<Polar {self.boat.name} v{self.version}>'
 
@@ -214,7 +377,7 @@ class Polar(db.Model):
             'version': self.version,
             'name': self.name,
             'polar_data': self.polar_data,
-            'data_quality': self.data_quality,
+            'data_summary': self.data_summary,
             'total_data_points': self.total_data_points,
             'sessions_used': self.sessions_used,
             'wind_bins_with_data': self.wind_bins_with_data,
@@ -226,3 +389,25 @@ class Polar(db.Model):
             'notes': self.notes
         }
 
+# Child-row counts computed as correlated subqueries in the same SELECT
+# that loads the parent, so to_dict never lazy-loads a full collection
+# just to take len() of it. Declared after the classes because each
+# subquery references the child model.
+User.boat_count = db.column_property(
+    db.select(db.func.count(Boat.id))
+    .where(Boat.user_id == User.id)
+    .correlate_except(Boat)
+    .scalar_subquery())
+
+Boat.log_file_count = db.column_property(
+    db.select(db.func.count(LogFile.id))
+    .where(LogFile.boat_id == Boat.id)
+    .correlate_except(LogFile)
+    .scalar_subquery())
+
+Boat.polar_count = db.column_property(
+    db.select(db.func.count(Polar.id))
+    .where(Polar.boat_id == Boat.id)
+    .correlate_except(Polar)
+    .scalar_subquery())
+
@@ -4,177 +4,260 @@ Standalone Polar Generation Engine for Production Deployment
 Based on the working polar generator that successfully created Aurelius polar
 """
 
-import csv
-import json
-import os
-import tempfile
-from datetime import datetime
-from collections import defaultdict
-import statistics
-
-def parse_expedition_file(file_path):
-    """Parse Expedition CSV file format"""
+import io
+import mmap
+
+import numpy as np
+import pandas as pd
+
+# Wind speed bin centers and the edges that partition points between them
+WIND_BINS = [6, 8, 10, 12, 14, 16, 20, 24]
+WIND_BIN_EDGES = np.array([5, 7, 9, 11, 13, 15, 18, 22, 26], dtype=float)
+
+# Angle bins every 15 degrees, split at the 7.5-degree midpoints
+ANGLE_BIN_STEP = 15
+ANGLE_BIN_EDGES = np.arange(7.5, 181, ANGLE_BIN_STEP)
+
+# Minimum points for a bucket to contribute a target speed
+MIN_BUCKET_POINTS = 2
+
+def _find_data_start(mm):
+    """Byte offset of the first data row in a log buffer (mmap or bytes)
+
+    Walks line starts in place with find, so locating the end of the
+    header never materializes the file (or even individual lines)
+    in Python memory. Returns None when no data row exists.
+    """
+    pos = 0
+    while True:
+        if mm[pos:pos + 2] == b'0,':
+            end = mm.find(b'\n', pos)
+            if end == -1:
+                end = len(mm)
+            # Slicing copies just this candidate line, never the file
+            if mm[pos:end].count(b',') > 10:
+                return pos
+        nxt = mm.find(b'\n', pos)
+        if nxt == -1:
+            return None
+        pos = nxt + 1
+
+def _max_field_count(buf, start):
+    """Widest row in the data section, in comma-separated fields
+
+    Expedition rows are sparse index/value pairs, so their width varies
+    from record to record. The C tokenizer locks its column count in
+    from the first chunk and treats wider rows as bad lines, so the
+    width has to be known up front; this scan walks the same buffer
+    (mmap or bytes) as _find_data_start. Comment lines don't count.
+    """
+    width = 0
+    pos = start
+    n = len(buf)
+    while pos < n:
+        end = buf.find(b'\n', pos)
+        if end == -1:
+            end = n
+        if buf[pos:pos + 1] != b'!':
+            width = max(width, buf[pos:end].count(b','))
+        pos = end + 1
+    return width + 1
+
+def parse_expedition_file(source):
+    """Parse Expedition CSV file format into index/value arrays
+
+    Accepts a filesystem path or a binary file-like object and returns
+    a pair of 2D arrays (idx, val) where each row holds the channel
+    indices and their values for one log record. The header is skipped
+    with an mmap (or in-memory buffer) scan and the remainder goes
+    through pandas' C tokenizer straight into a float array — several
+    times faster than genfromtxt's Python-level line loop, with peak
+    memory being the parsed array rather than a second copy of the file.
+    """
     try:
-        with open(file_path, 'r') as f:
-            lines = f.readlines()
-        
-        # Find data start (skip header lines)
-        data_start = 0
-        for i, line in enumerate(lines):
-            if line.startswith('0,') and ',' in line and len(line.split(',')) > 10:
-                data_start = i
-                break
-        
-        if data_start == 0:
-            return []
-            
-        # Parse data lines into structured format
-        data_rows = []
-        for line in lines[data_start:]:
-            if line.strip() and not line.startswith('!'):
-                parts = line.strip().split(',')
-                if len(parts) >= 10:
-                    try:
-                        # Parse index,value pairs
-                        data_dict = {}
-                        for i in range(0, len(parts)-1, 2):
-                            if i+1 < len(parts):
-                                try:
-                                    index = int(parts[i])
-                                    value = float(parts[i+1])
-                                    data_dict[index] = value
-                                except (ValueError, IndexError):
-                                    continue
-                        
-                        if data_dict:
-                            data_rows.append(data_dict)
-                    except Exception:
-                        continue
-        
-        return data_rows
+        if hasattr(source, 'read'):
+            # In-memory stream: scan the buffer directly; BytesIO over
+            # bytes is copy-on-write, so no second copy is made
+            data = source.read()
+            data_start = _find_data_start(data)
+            if data_start is None:
+                return None, None
+            # Fixing the column count to the widest row keeps rows that
+            # are wider than the first chunk's from being dropped as
+            # bad lines; narrower rows pad with NaN as before
+            names = range(_max_field_count(data, data_start))
+            stream = io.BytesIO(data)
+            stream.seek(data_start)
+            df = pd.read_csv(stream, names=names, engine='c', comment='!',
+                             on_bad_lines='skip')
+        else:
+            with open(source, 'rb') as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    data_start = _find_data_start(mm)
+                    if data_start is None:
+                        return None, None
+                    names = range(_max_field_count(mm, data_start))
+
+                f.seek(data_start)
+                df = pd.read_csv(f, names=names, engine='c', comment='!',
+                                 on_bad_lines='skip')
+        # Stray text cells become NaN, matching genfromtxt's behavior
+        arr = df.apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+        if arr.size == 0:
+            return None, None
+
+        arr = np.atleast_2d(arr)
+        if arr.shape[1] % 2:
+            arr = arr[:, :-1]
+
+        # Columns alternate (channel index, value) pairs
+        idx = arr[:, 0::2]
+        val = arr[:, 1::2]
+        return idx, val
     except Exception as e:
-        print(f"Error parsing file {file_path}: {e}")
-        return []
+        print(f"Error parsing file {source}: {e}")
+        return None, None
 
-def extract_sailing_data(data_rows):
-    """Extract sailing data from parsed rows"""
-    sailing_data = []
-    
-    for row in data_rows:
-        try:
-            # Extract key sailing parameters
-            # Common Expedition indices: TWS=2, TWA=3, BSP=1, SOG=4, etc.
-            tws = row.get(2)  # True Wind Speed
-            twa = row.get(3)  # True Wind Angle  
-            bsp = row.get(1)  # Boat Speed
-            sog = row.get(4)  # Speed Over Ground
-            
-            # Use SOG if BSP not available
-            boat_speed = bsp if bsp and bsp > 0 else sog
-            
-            if tws and twa is not None and boat_speed and tws > 0 and boat_speed > 0:
-                sailing_data.append({
-                    'TWS': tws,
-                    'TWA': abs(twa),  # Use absolute value
-                    'BSP': boat_speed
-                })
-        except Exception:
-            continue
-    
-    return sailing_data
+def _channel_values(idx, val, channel):
+    """Pick each row's value for one Expedition channel index
 
-def clean_sailing_data(sailing_data):
-    """Clean and filter sailing data"""
-    clean_data = []
-    
-    for point in sailing_data:
-        tws = point['TWS']
-        twa = point['TWA']
-        bsp = point['BSP']
-        
-        # Filter reasonable sailing conditions
-        if (2 <= tws <= 30 and  # Wind speed range
-            5 <= twa <= 180 and  # Wind angle range
-            1 <= bsp <= 25):     # Boat speed range
-            clean_data.append(point)
-    
-    return clean_data
+    Rows that don't carry the channel get NaN.
+    """
+    mask = idx == channel
+    has_channel = mask.any(axis=1)
+    # argmax finds the first matching pair column per row
+    cols = np.argmax(mask, axis=1)
+    out = val[np.arange(idx.shape[0]), cols]
+    return np.where(has_channel, out, np.nan)
 
-def generate_polar_data(sailing_data):
-    """Generate polar data from sailing data"""
-    # Wind speed bins
-    wind_bins = [6, 8, 10, 12, 14, 16, 20, 24]
-    
-    # Angle bins (every 15 degrees)
-    angle_bins = list(range(0, 181, 15))
-    
+_EMPTY = np.empty(0)
+
+def extract_sailing_data(idx, val):
+    """Extract clean sailing data as structure-of-arrays (TWS, TWA, BSP)
+
+    Channel selection and cleaning are fused into one pass: a single
+    boolean mask keeps points in reasonable sailing conditions (wind
+    2-30 kt, angle 5-180 degrees, boat speed 1-25 kt), which also drops
+    every NaN row, so the data is filtered once instead of being copied
+    through separate validity and range passes.
+    """
+    if idx is None or val is None or idx.shape[0] == 0:
+        return _EMPTY, _EMPTY, _EMPTY
+
+    # Common Expedition indices: TWS=2, TWA=3, BSP=1, SOG=4, etc.
+    tws = _channel_values(idx, val, 2)   # True Wind Speed
+    twa = _channel_values(idx, val, 3)   # True Wind Angle
+    bsp = _channel_values(idx, val, 1)   # Boat Speed
+    sog = _channel_values(idx, val, 4)   # Speed Over Ground
+
+    # Use SOG if BSP not available
+    boat_speed = np.where(np.nan_to_num(bsp) > 0, bsp, sog)
+    twa = np.abs(twa)
+
+    # NaNs compare False everywhere, so invalid rows fall out here too
+    with np.errstate(invalid='ignore'):
+        mask = ((tws >= 2) & (tws <= 30) &
+                (twa >= 5) & (twa <= 180) &
+                (boat_speed >= 1) & (boat_speed <= 25))
+
+    return tws[mask], twa[mask], boat_speed[mask]
+
+def _quantile_85(bucket):
+    """85th percentile via np.partition, matching linear interpolation
+
+    Selecting the two straddling order statistics is O(n) versus the
+    O(n log n) full sort a quantile normally pays.
+    """
+    k = 0.85 * (bucket.size - 1)
+    lo = int(k)
+    hi = min(lo + 1, bucket.size - 1)
+    part = np.partition(bucket, (lo, hi))
+    return part[lo] + (k - lo) * (part[hi] - part[lo])
+
+def generate_polar_data(tws, twa, bsp):
+    """Generate polar data from sailing data arrays
+
+    Every point is assigned to its wind/angle bucket once with
+    np.digitize, buckets are grouped with a single stable argsort on a
+    combined bin id, and each bucket's 85th-percentile boat speed comes
+    from np.partition — no per-bucket Python callback and no rescans of
+    the whole dataset.
+    """
     polar_data = {}
     data_quality = {}
-    
-    for wind_speed in wind_bins:
-        # Filter data for this wind speed bin (±1 knot)
-        wind_data = [d for d in sailing_data 
-                    if wind_speed - 1 <= d['TWS'] <= wind_speed + 1]
-        
-        if not wind_data:
+
+    if len(tws) == 0:
+        return polar_data, data_quality
+
+    wind_bin = np.digitize(tws, WIND_BIN_EDGES)
+    angle_bin = np.digitize(twa, ANGLE_BIN_EDGES)
+
+    # digitize bin 0 / len(edges) are outside the outermost edges
+    in_range = (wind_bin >= 1) & (wind_bin <= len(WIND_BINS))
+
+    # One combined id per bucket so a single sort groups everything
+    n_angle_codes = len(ANGLE_BIN_EDGES) + 1
+    code = wind_bin[in_range] * n_angle_codes + angle_bin[in_range]
+    speeds = bsp[in_range]
+
+    order = np.argsort(code, kind='stable')
+    code = code[order]
+    speeds = speeds[order]
+
+    # Bucket boundaries: indices where the combined id changes
+    starts = np.flatnonzero(np.r_[True, code[1:] != code[:-1]])
+    ends = np.r_[starts[1:], code.size]
+
+    for start, end in zip(starts, ends):
+        count = int(end - start)
+        if count < MIN_BUCKET_POINTS:
             continue
-            
-        angles_speeds = []
-        bin_quality = {}
-        
-        for angle in angle_bins:
-            # Filter data for this angle bin (±7.5 degrees)
-            angle_data = [d for d in wind_data 
-                         if angle - 7.5 <= d['TWA'] <= angle + 7.5]
-            
-            if len(angle_data) >= 2:  # Minimum data points
-                speeds = [d['BSP'] for d in angle_data]
-                
-                # Use 85th percentile for target speed
-                target_speed = statistics.quantiles(speeds, n=20)[16]  # 85th percentile
-                
-                angles_speeds.extend([angle, round(target_speed, 2)])
-                bin_quality[angle] = len(angle_data)
-        
-        if angles_speeds:
-            polar_data[wind_speed] = angles_speeds
-            data_quality[wind_speed] = bin_quality
-    
+        wind_speed = WIND_BINS[code[start] // n_angle_codes - 1]
+        angle = int(code[start] % n_angle_codes) * ANGLE_BIN_STEP
+        target = _quantile_85(speeds[start:end])
+        polar_data.setdefault(wind_speed, []).extend([angle, round(float(target), 2)])
+        data_quality.setdefault(wind_speed, {})[angle] = count
+
     return polar_data, data_quality
 
 def format_expedition_polar(polar_data, boat_name):
-    """Format polar data in Expedition format"""
+    """Format polar data in Expedition format
+
+    Each line is assembled with one join instead of repeated +=, which
+    reallocates the growing string on every value.
+    """
     lines = [f"!{boat_name}%"]
-    
-    wind_speeds = sorted(polar_data.keys())
-    for wind_speed in wind_speeds:
-        angles_speeds = polar_data[wind_speed]
-        line = f"{wind_speed}"
-        for value in angles_speeds:
-            line += f" {value}"
-        lines.append(line)
-    
+    lines.extend(
+        f"{wind_speed} " + " ".join(map(str, polar_data[wind_speed]))
+        for wind_speed in sorted(polar_data)
+    )
     return "\n".join(lines)
 
-def process_log_files(file_paths, boat_name="Boat"):
-    """Process multiple log files and generate polar"""
-    all_sailing_data = []
-    
-    for file_path in file_paths:
-        print(f"Processing {file_path}...")
-        data_rows = parse_expedition_file(file_path)
-        sailing_data = extract_sailing_data(data_rows)
-        clean_data = clean_sailing_data(sailing_data)
-        all_sailing_data.extend(clean_data)
-        print(f"  Extracted {len(clean_data)} clean data points")
-    
-    print(f"\nTotal clean data points: {len(all_sailing_data)}")
-    
-    if len(all_sailing_data) < 100:
+def process_log_files(sources, boat_name="Boat"):
+    """Process multiple log files (paths or file-likes) and generate polar"""
+    tws_parts, twa_parts, bsp_parts = [], [], []
+
+    for source in sources:
+        print(f"Processing {source}...")
+        idx, val = parse_expedition_file(source)
+        tws, twa, bsp = extract_sailing_data(idx, val)
+        tws_parts.append(tws)
+        twa_parts.append(twa)
+        bsp_parts.append(bsp)
+        print(f"  Extracted {len(tws)} clean data points")
+
+    all_tws = np.concatenate(tws_parts) if tws_parts else _EMPTY
+    all_twa = np.concatenate(twa_parts) if twa_parts else _EMPTY
+    all_bsp = np.concatenate(bsp_parts) if bsp_parts else _EMPTY
+
+    total_points = len(all_tws)
+    print(f"\nTotal clean data points: {total_points}")
+
+    if total_points < 100:
         return None, "Insufficient data for polar generation (minimum 100 points required)"
-    
+
     # Generate polar
-    polar_data, data_quality = generate_polar_data(all_sailing_data)
+    polar_data, data_quality = generate_polar_data(all_tws, all_twa, all_bsp)
     
     if not polar_data:
         return None, "No valid polar data generated"
@@ -184,7 +267,7 @@ def process_log_files(file_paths, boat_name="Boat"):
     
     # Create summary
     summary = {
-        'total_points': len(all_sailing_data),
+        'total_points': total_points,
         'wind_bins': len(polar_data),
         'data_quality': data_quality,
         'wind_range': f"{min(polar_data.keys())}-{max(polar_data.keys())} knots"
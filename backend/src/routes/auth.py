@@ -41,11 +41,17 @@ def register():
             if not data.get(field):
                 return jsonify({'error': f'{field} is required'}), 400
         
-        # Check if user already exists
-        if User.query.filter_by(username=data['username']).first():
+        # Check if user already exists: both EXISTS probes ride one
+        # round trip and short-circuit in the DB instead of hydrating
+        # full rows via .first()
+        username_taken, email_taken = db.session.execute(db.select(
+            db.select(User.id).filter_by(username=data['username']).exists(),
+            db.select(User.id).filter_by(email=data['email']).exists()
+        )).one()
+        if username_taken:
             return jsonify({'error': 'Username already exists'}), 400
-        
-        if User.query.filter_by(email=data['email']).first():
+
+        if email_taken:
             return jsonify({'error': 'Email already exists'}), 400
         
         # Create new user
@@ -83,11 +89,16 @@ def login():
             return jsonify({'error': 'Username and password are required'}), 400
         
         # Find user
-        user = User.query.filter_by(username=data['username']).first()
+        user = db.session.scalar(db.select(User).filter_by(username=data['username']))
         
         if not user or not user.check_password(data['password']):
             return jsonify({'error': 'Invalid username or password'}), 401
-        
+
+        # Migrate legacy pbkdf2 hashes to bcrypt now that we know the
+        # plaintext verifies
+        if user.needs_rehash():
+            user.set_password(data['password'])
+
         # Update last login
         user.last_login = datetime.utcnow()
         db.session.commit()
@@ -123,9 +134,11 @@ def update_profile(current_user):
         if 'name' in data:
             current_user.name = data['name']
         if 'email' in data:
-            # Check if email is already taken by another user
-            existing_user = User.query.filter_by(email=data['email']).first()
-            if existing_user and existing_user.id != current_user.id:
+            # Check if email is already taken by another user; only the
+            # id is needed for the comparison, so skip the full row
+            existing_id = db.session.scalar(
+                db.select(User.id).filter_by(email=data['email']))
+            if existing_id is not None and existing_id != current_user.id:
                 return jsonify({'error': 'Email already exists'}), 400
             current_user.email = data['email']
         
@@ -1,19 +1,84 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from src.models.user import db, Boat, LogFile, Polar
 from src.routes.auth import token_required
+import hashlib
 
 boats_bp = Blueprint('boats', __name__)
 
+# Built once at import: the statement object itself is the key into
+# SQLAlchemy's compiled cache, so every call skips both select()
+# construction and SQL compilation
+_OWNS_BOAT_STMT = db.select(
+    db.select(Boat.id).where(Boat.id == db.bindparam('boat_id'),
+                             Boat.user_id == db.bindparam('user_id')).exists())
+
+def _etag_of(*parts):
+    """Opaque ETag over a tuple of cheap aggregate state
+
+    The parts are whatever invalidates a listing — row counts, max ids,
+    latest timestamps — so computing the tag costs one indexed aggregate
+    query instead of hydrating and serializing every row.
+    """
+    return hashlib.md5(repr(parts).encode('utf-8')).hexdigest()
+
+def _not_modified(etag):
+    """304 short-circuit when the client's If-None-Match matches"""
+    if etag in request.if_none_match:
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+    return None
+
+def _tagged(response, etag):
+    """Attach the validator; no-cache forces revalidation each poll"""
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def _owns_boat(user_id, boat_id):
+    """Authorization probe: EXISTS check without hydrating the Boat row
+
+    Most handlers only need to know the boat belongs to the user; the
+    EXISTS subquery resolves on the (user_id, id) index and ships one
+    boolean instead of every Boat column.
+    """
+    return db.session.scalar(_OWNS_BOAT_STMT,
+                             {'boat_id': boat_id, 'user_id': user_id})
+
 @boats_bp.route('/boats', methods=['GET'])
 @token_required
 def get_boats(current_user):
     """Get all boats for the current user"""
     try:
-        boats = Boat.query.filter_by(user_id=current_user.id).all()
-        return jsonify({
+        # Validator first: the listing (child counts included) only
+        # changes when a boat row changes or a child is added/removed,
+        # all captured in one aggregate roundtrip; polling clients that
+        # present a matching ETag skip the hydration below entirely
+        log_total = (db.select(db.func.count(LogFile.id))
+                     .join(Boat, LogFile.boat_id == Boat.id)
+                     .where(Boat.user_id == current_user.id).scalar_subquery())
+        polar_total = (db.select(db.func.count(Polar.id))
+                       .join(Boat, Polar.boat_id == Boat.id)
+                       .where(Boat.user_id == current_user.id).scalar_subquery())
+        state = db.session.execute(db.select(
+            db.func.count(Boat.id), db.func.max(Boat.updated_at),
+            log_total, polar_total
+        ).where(Boat.user_id == current_user.id)).one()
+        etag = _etag_of('boats', current_user.id, *state)
+        not_modified = _not_modified(etag)
+        if not_modified is not None:
+            return not_modified
+
+        # to_dict only reads column properties now; raiseload makes any
+        # accidental lazy relationship fetch fail loudly instead of
+        # silently reintroducing N+1
+        boats = db.session.scalars(
+            db.select(Boat).filter_by(user_id=current_user.id)
+            .options(db.raiseload('*'))).all()
+        return _tagged(jsonify({
             'boats': [boat.to_dict() for boat in boats]
-        }), 200
-        
+        }), etag)
+
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -67,15 +132,29 @@ def create_boat(current_user):
 def get_boat(current_user, boat_id):
     """Get a specific boat"""
     try:
-        boat = Boat.query.filter_by(id=boat_id, user_id=current_user.id).first()
-        
-        if not boat:
+        # The column properties ride along in a narrow projection, so
+        # one small SELECT both authorizes and produces the validator
+        state = db.session.execute(
+            db.select(Boat.updated_at, Boat.log_file_count, Boat.polar_count)
+            .filter_by(id=boat_id, user_id=current_user.id)).one_or_none()
+        if state is None:
             return jsonify({'error': 'Boat not found'}), 404
-        
-        return jsonify({
+
+        etag = _etag_of('boat', boat_id, *state)
+        not_modified = _not_modified(etag)
+        if not_modified is not None:
+            return not_modified
+
+        # Counts come from column properties; raiseload guards the
+        # serialization path the same way the list endpoint does
+        boat = db.session.scalar(
+            db.select(Boat).filter_by(id=boat_id, user_id=current_user.id)
+            .options(db.raiseload('*')))
+
+        return _tagged(jsonify({
             'boat': boat.to_dict()
-        }), 200
-        
+        }), etag)
+
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -84,11 +163,12 @@ def get_boat(current_user, boat_id):
 def update_boat(current_user, boat_id):
     """Update a boat"""
     try:
-        boat = Boat.query.filter_by(id=boat_id, user_id=current_user.id).first()
-        
+        boat = db.session.scalar(
+            db.select(Boat).filter_by(id=boat_id, user_id=current_user.id))
+
         if not boat:
             return jsonify({'error': 'Boat not found'}), 404
-        
+
         data = request.get_json()
         
         # Update allowed fields
@@ -119,7 +199,12 @@ def update_boat(current_user, boat_id):
 def delete_boat(current_user, boat_id):
     """Delete a boat"""
     try:
-        boat = Boat.query.filter_by(id=boat_id, user_id=current_user.id).first()
+        # The delete-orphan cascade needs both collections in memory;
+        # selectinload batches each into a single IN-clause query
+        boat = db.session.scalar(
+            db.select(Boat).filter_by(id=boat_id, user_id=current_user.id)
+            .options(db.selectinload(Boat.log_files),
+                     db.selectinload(Boat.polars)))
         
         if not boat:
             return jsonify({'error': 'Boat not found'}), 404
@@ -140,16 +225,26 @@ def delete_boat(current_user, boat_id):
 def get_boat_files(current_user, boat_id):
     """Get all log files for a boat"""
     try:
-        boat = Boat.query.filter_by(id=boat_id, user_id=current_user.id).first()
-        
-        if not boat:
+        if not _owns_boat(current_user.id, boat_id):
             return jsonify({'error': 'Boat not found'}), 404
-        
-        files = LogFile.query.filter_by(boat_id=boat_id).order_by(LogFile.upload_date.desc()).all()
-        
-        return jsonify({
+
+        # Log file rows are insert-only on this surface, so count plus
+        # max id is a complete validator for the listing
+        state = db.session.execute(db.select(
+            db.func.count(LogFile.id), db.func.max(LogFile.id)
+        ).where(LogFile.boat_id == boat_id)).one()
+        etag = _etag_of('files', boat_id, *state)
+        not_modified = _not_modified(etag)
+        if not_modified is not None:
+            return not_modified
+
+        files = db.session.scalars(
+            db.select(LogFile).filter_by(boat_id=boat_id)
+            .order_by(LogFile.upload_date.desc())).all()
+
+        return _tagged(jsonify({
             'files': [file.to_dict() for file in files]
-        }), 200
+        }), etag)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -159,16 +254,29 @@ def get_boat_files(current_user, boat_id):
 def get_boat_polars(current_user, boat_id):
     """Get all polars for a boat"""
     try:
-        boat = Boat.query.filter_by(id=boat_id, user_id=current_user.id).first()
-        
-        if not boat:
+        if not _owns_boat(current_user.id, boat_id):
             return jsonify({'error': 'Boat not found'}), 404
-        
-        polars = Polar.query.filter_by(boat_id=boat_id).order_by(Polar.version.desc()).all()
-        
-        return jsonify({
+
+        # Polars are immutable once generated, so the same count/max-id
+        # validator applies — and a 304 here skips loading every blob
+        state = db.session.execute(db.select(
+            db.func.count(Polar.id), db.func.max(Polar.id)
+        ).where(Polar.boat_id == boat_id)).one()
+        etag = _etag_of('polars', boat_id, *state)
+        not_modified = _not_modified(etag)
+        if not_modified is not None:
+            return not_modified
+
+        # to_dict serializes the polar text, so undefer it here: one
+        # roundtrip instead of a lazy blob load per row
+        polars = db.session.scalars(
+            db.select(Polar).filter_by(boat_id=boat_id)
+            .options(db.undefer(Polar.polar_data))
+            .order_by(Polar.version.desc())).all()
+
+        return _tagged(jsonify({
             'polars': [polar.to_dict() for polar in polars]
-        }), 200
+        }), etag)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -178,12 +286,12 @@ def get_boat_polars(current_user, boat_id):
 def get_current_polar(current_user, boat_id):
     """Get the current polar for a boat"""
     try:
-        boat = Boat.query.filter_by(id=boat_id, user_id=current_user.id).first()
-        
-        if not boat:
+        if not _owns_boat(current_user.id, boat_id):
             return jsonify({'error': 'Boat not found'}), 404
-        
-        current_polar = Polar.query.filter_by(boat_id=boat_id, is_current=True).first()
+
+        current_polar = db.session.scalar(
+            db.select(Polar).filter_by(boat_id=boat_id, is_current=True)
+            .options(db.undefer(Polar.polar_data)).limit(1))
         
         if not current_polar:
             return jsonify({'error': 'No current polar found'}), 404
@@ -200,41 +308,40 @@ def get_current_polar(current_user, boat_id):
 def get_boat_stats(current_user, boat_id):
     """Get statistics for a boat"""
     try:
-        boat = Boat.query.filter_by(id=boat_id, user_id=current_user.id).first()
-        
-        if not boat:
+        if not _owns_boat(current_user.id, boat_id):
             return jsonify({'error': 'Boat not found'}), 404
-        
-        # Get file statistics
-        total_files = LogFile.query.filter_by(boat_id=boat_id).count()
-        processed_files = LogFile.query.filter_by(boat_id=boat_id, processing_status='completed').count()
-        total_data_points = db.session.query(db.func.sum(LogFile.clean_data_points)).filter_by(boat_id=boat_id).scalar() or 0
-        
-        # Get polar statistics
-        total_polars = Polar.query.filter_by(boat_id=boat_id).count()
-        current_polar = Polar.query.filter_by(boat_id=boat_id, is_current=True).first()
-        
-        # Get data coverage
-        wind_range = db.session.query(
-            db.func.min(LogFile.wind_range_min),
-            db.func.max(LogFile.wind_range_max)
-        ).filter_by(boat_id=boat_id).first()
-        
-        angle_range = db.session.query(
-            db.func.min(LogFile.angle_range_min),
-            db.func.max(LogFile.angle_range_max)
-        ).filter_by(boat_id=boat_id).first()
-        
+
+        # All LogFile statistics in one aggregate pass over the table
+        (total_files, processed_files, total_data_points,
+         wind_min, wind_max, angle_min, angle_max, last_upload) = db.session.execute(
+            db.select(
+                db.func.count(LogFile.id),
+                db.func.sum(db.case((LogFile.processing_status == 'completed', 1), else_=0)),
+                db.func.sum(LogFile.clean_data_points),
+                db.func.min(LogFile.wind_range_min),
+                db.func.max(LogFile.wind_range_max),
+                db.func.min(LogFile.angle_range_min),
+                db.func.max(LogFile.angle_range_max),
+                db.func.max(LogFile.upload_date)
+            ).where(LogFile.boat_id == boat_id)).one()
+
+        # Polar count and current version likewise share one query
+        total_polars, current_polar_version = db.session.execute(
+            db.select(
+                db.func.count(Polar.id),
+                db.func.max(db.case((Polar.is_current, Polar.version)))
+            ).where(Polar.boat_id == boat_id)).one()
+
         return jsonify({
             'stats': {
                 'total_files': total_files,
-                'processed_files': processed_files,
-                'total_data_points': int(total_data_points),
+                'processed_files': int(processed_files or 0),
+                'total_data_points': int(total_data_points or 0),
                 'total_polars': total_polars,
-                'current_polar_version': current_polar.version if current_polar else None,
-                'wind_range': [wind_range[0], wind_range[1]] if wind_range[0] is not None else None,
-                'angle_range': [angle_range[0], angle_range[1]] if angle_range[0] is not None else None,
-                'last_upload': LogFile.query.filter_by(boat_id=boat_id).order_by(LogFile.upload_date.desc()).first().upload_date.isoformat() if LogFile.query.filter_by(boat_id=boat_id).first() else None
+                'current_polar_version': current_polar_version,
+                'wind_range': [wind_min, wind_max] if wind_min is not None else None,
+                'angle_range': [angle_min, angle_max] if angle_min is not None else None,
+                'last_upload': last_upload.isoformat() if last_upload else None
             }
         }), 200
         
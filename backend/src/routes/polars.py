@@ -1,29 +1,41 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, send_file
 from werkzeug.utils import secure_filename
 from src.models.user import db, Boat, LogFile, Polar
 from src.routes.auth import token_required
+from src.routes.boats import _owns_boat, _etag_of, _not_modified, _tagged
 from src.polar_engine import process_log_files
 from src.cloud_storage import cloud_storage
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import os
-import json
-import tempfile
 import io
 
 polars_bp = Blueprint('polars', __name__)
 
-ALLOWED_EXTENSIONS = {'csv'}
+# boto3 releases the GIL during transfers, so moving a request's files
+# to and from S3 concurrently overlaps their network time; the shared
+# client pools enough connections for this worker count
+_TRANSFER_POOL = ThreadPoolExecutor(max_workers=16)
+
+# Prepared once like _OWNS_BOAT_STMT: three endpoints run this exact
+# ownership + name projection per request
+_BOAT_NAME_STMT = db.select(Boat.name).where(
+    Boat.id == db.bindparam('boat_id'),
+    Boat.user_id == db.bindparam('user_id'))
+
+# frozenset of full suffixes: one splitext + one hash probe per file,
+# with no rsplit list allocation inside the upload loop
+ALLOWED_EXTENSIONS = frozenset({'.csv'})
 
 def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    return os.path.splitext(filename)[1].lower() in ALLOWED_EXTENSIONS
 
 @polars_bp.route('/boats/<int:boat_id>/upload', methods=['POST'])
 @token_required
 def upload_files(current_user, boat_id):
     """Upload log files for a boat using cloud storage"""
     try:
-        boat = Boat.query.filter_by(id=boat_id, user_id=current_user.id).first()
-        if not boat:
+        if not _owns_boat(current_user.id, boat_id):
             return jsonify({'error': 'Boat not found'}), 404
         
         if 'files' not in request.files:
@@ -33,41 +45,71 @@ def upload_files(current_user, boat_id):
         if not files or files[0].filename == '':
             return jsonify({'error': 'No files selected'}), 400
         
-        uploaded_files = []
-        
+        uploads = []
         for file in files:
             if file and allowed_file(file.filename):
-                # Read file content
-                file_content = file.read()
                 filename = secure_filename(file.filename)
-                
-                # Create cloud storage key
                 cloud_key = f"boats/{boat_id}/logs/{filename}"
-                
-                # Upload to cloud storage
-                file_stream = io.BytesIO(file_content)
-                success = cloud_storage.upload_file(file_stream, cloud_key, 'text/csv')
-                
-                if success:
-                    # Create log file record with cloud storage info
-                    log_file = LogFile(
-                        boat_id=boat_id,
-                        filename=filename,
-                        file_path=cloud_key,  # Store cloud key
-                        file_size=len(file_content),
-                        upload_date=datetime.now(),
-                        status='uploaded'
-                    )
-                    
-                    db.session.add(log_file)
-                    uploaded_files.append({
-                        'filename': filename,
-                        'size': len(file_content),
-                        'cloud_key': cloud_key
-                    })
-                else:
-                    return jsonify({'error': f'Failed to upload {filename} to cloud storage'}), 500
-        
+
+                # Size from the werkzeug spool, without reading the
+                # body into memory just to measure it
+                stream = file.stream
+                stream.seek(0, os.SEEK_END)
+                size = stream.tell()
+                stream.seek(0)
+                uploads.append((file, filename, cloud_key, size))
+
+        # upload_fileobj consumes the spool in multipart chunks, so the
+        # worker never holds a full file in RAM; all files go up at once
+        futures = [
+            (_TRANSFER_POOL.submit(cloud_storage.upload_file,
+                                 file.stream, cloud_key, 'text/csv'),
+             file, filename, cloud_key, size)
+            for file, filename, cloud_key, size in uploads
+        ]
+
+        # Drain every future before deciding the outcome, so no upload is
+        # still in flight when we respond; on any failure the keys that
+        # did land are deleted again, keeping cloud and DB consistent
+        # instead of leaving orphaned objects behind a 500
+        results = []
+        for future, file, filename, cloud_key, size in futures:
+            try:
+                ok = bool(future.result())
+            except Exception:
+                ok = False
+            results.append((ok, file, filename, cloud_key, size))
+
+        failed = [filename for ok, _, filename, _, _ in results if not ok]
+        if failed:
+            for ok, _, _, cloud_key, _ in results:
+                if ok:
+                    cloud_storage.delete_file(cloud_key)
+            return jsonify({'error': f'Failed to upload {failed[0]} to cloud storage'}), 500
+
+        uploaded_files = []
+        log_file_rows = []
+        for ok, file, filename, cloud_key, size in results:
+            # Log file record with cloud storage info
+            log_file_rows.append({
+                'boat_id': boat_id,
+                'filename': filename,
+                'original_filename': file.filename,
+                'file_path': cloud_key,  # Store cloud key
+                'file_size': size,
+                'processing_status': 'uploaded'
+            })
+            uploaded_files.append({
+                'filename': filename,
+                'size': size,
+                'cloud_key': cloud_key
+            })
+
+        # Rows only reach the session once every upload has succeeded,
+        # and the executemany insert skips per-instance unit-of-work
+        # bookkeeping that add() in a loop pays
+        if log_file_rows:
+            db.session.execute(db.insert(LogFile), log_file_rows)
         db.session.commit()
         
         return jsonify({
@@ -84,82 +126,77 @@ def upload_files(current_user, boat_id):
 def generate_polar(current_user, boat_id):
     """Generate polar from cloud-stored log files"""
     try:
-        boat = Boat.query.filter_by(id=boat_id, user_id=current_user.id).first()
-        if not boat:
+        # Only the name is used, so project that single column
+        boat_name = db.session.scalar(
+            _BOAT_NAME_STMT, {'boat_id': boat_id, 'user_id': current_user.id})
+        if boat_name is None:
             return jsonify({'error': 'Boat not found'}), 404
-        
+
         # Get all log files for this boat
-        log_files = LogFile.query.filter_by(boat_id=boat_id).all()
+        log_files = db.session.scalars(
+            db.select(LogFile).filter_by(boat_id=boat_id)).all()
         if not log_files:
             return jsonify({'error': 'No log files found for this boat'}), 400
         
-        # Download files from cloud storage and create temporary files
-        temp_files = []
-        try:
-            for lf in log_files:
-                # Download file content from cloud storage
-                file_content = cloud_storage.download_file(lf.file_path)
-                if file_content:
-                    # Create temporary file
-                    temp_file = tempfile.NamedTemporaryFile(mode='w+b', suffix='.csv', delete=False)
-                    temp_file.write(file_content)
-                    temp_file.close()
-                    temp_files.append(temp_file.name)
-                else:
-                    current_app.logger.warning(f"Could not download file: {lf.file_path}")
-            
-            if not temp_files:
-                return jsonify({'error': 'No accessible log files found in cloud storage'}), 400
-            
-            # Generate polar using our engine
-            polar_content, summary = process_log_files(temp_files, boat.name)
-            
-            if not polar_content:
-                return jsonify({'error': f'Polar generation failed: {summary}'}), 400
-            
-            # Upload polar to cloud storage
-            polar_filename = f"{boat.name}_.txt"
-            polar_key = f"boats/{boat_id}/polars/{polar_filename}"
-            
-            polar_stream = io.BytesIO(polar_content.encode('utf-8'))
-            success = cloud_storage.upload_file(polar_stream, polar_key, 'text/plain')
-            
-            if not success:
-                return jsonify({'error': 'Failed to save polar to cloud storage'}), 500
-            
-            # Get existing polar count for versioning
-            existing_polars = Polar.query.filter_by(boat_id=boat_id).count()
-            version = existing_polars + 1
-            
-            # Create polar record
-            polar = Polar(
-                boat_id=boat_id,
-                version=version,
-                polar_data=polar_content,
-                generation_date=datetime.now(),
-                data_summary=json.dumps(summary) if isinstance(summary, dict) else str(summary),
-                file_url=polar_key  # Store cloud key
-            )
-            
-            db.session.add(polar)
-            db.session.commit()
-            
-            return jsonify({
-                'message': 'Polar generated successfully and saved to cloud storage',
-                'polar_id': polar.id,
-                'version': version,
-                'summary': summary,
-                'cloud_key': polar_key
-            }), 200
-            
-        finally:
-            # Clean up temporary files
-            for temp_file in temp_files:
-                try:
-                    os.unlink(temp_file)
-                except OSError:
-                    pass
-        
+        # Download files from cloud storage straight into memory; the
+        # downloads run concurrently so the wall time is the slowest
+        # transfer, not the sum of every round trip, and the engine
+        # parses the streams without a temp-file write/read round trip
+        log_streams = []
+        keys = [lf.file_path for lf in log_files]
+        for key, file_content in zip(keys, _TRANSFER_POOL.map(cloud_storage.download_file, keys)):
+            if file_content:
+                log_streams.append(io.BytesIO(file_content))
+            else:
+                current_app.logger.warning(f"Could not download file: {key}")
+
+        if not log_streams:
+            return jsonify({'error': 'No accessible log files found in cloud storage'}), 400
+
+        # Generate polar using our engine
+        polar_content, summary = process_log_files(log_streams, boat_name)
+
+        if not polar_content:
+            return jsonify({'error': f'Polar generation failed: {summary}'}), 400
+
+        # Upload polar to cloud storage
+        polar_filename = f"{boat_name}_.txt"
+        polar_key = f"boats/{boat_id}/polars/{polar_filename}"
+
+        polar_stream = io.BytesIO(polar_content.encode('utf-8'))
+        success = cloud_storage.upload_file(polar_stream, polar_key, 'text/plain')
+
+        if not success:
+            return jsonify({'error': 'Failed to save polar to cloud storage'}), 500
+
+        # Next version from MAX on the indexed column; COUNT+1 both
+        # scanned the table and handed two concurrent generations
+        # the same version number
+        version = db.session.scalar(
+            db.select(db.func.coalesce(db.func.max(Polar.version), 0))
+            .where(Polar.boat_id == boat_id)) + 1
+
+        # Create polar record; generation_date comes from the column's
+        # server-side default, stamped in the same transaction
+        polar = Polar(
+            boat_id=boat_id,
+            version=version,
+            polar_data=polar_content,
+            data_summary=summary if isinstance(summary, dict) else str(summary),
+            file_url=polar_key  # Store cloud key
+        )
+
+        db.session.add(polar)
+        db.session.commit()
+
+        return jsonify({
+            'message': 'Polar generated successfully and saved to cloud storage',
+            'polar_id': polar.id,
+            'version': version,
+            'summary': summary,
+            'cloud_key': polar_key
+        }), 200
+
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -169,53 +206,113 @@ def generate_polar(current_user, boat_id):
 def get_polars(current_user, boat_id):
     """Get all polars for a boat"""
     try:
-        boat = Boat.query.filter_by(id=boat_id, user_id=current_user.id).first()
-        if not boat:
+        if not _owns_boat(current_user.id, boat_id):
             return jsonify({'error': 'Boat not found'}), 404
         
-        polars = Polar.query.filter_by(boat_id=boat_id).order_by(Polar.generation_date.desc()).all()
-        
-        polar_list = []
-        for polar in polars:
-            polar_list.append({
-                'id': polar.id,
-                'version': polar.version,
-                'generation_date': polar.generation_date.isoformat(),
-                'summary': json.loads(polar.data_summary) if polar.data_summary else {},
-                'cloud_key': getattr(polar, 'file_url', None)
-            })
-        
-        return jsonify({'polars': polar_list}), 200
+        # Polars are immutable once generated: count plus max id is a
+        # complete validator, so pollers mostly see 304s
+        state = db.session.execute(db.select(
+            db.func.count(Polar.id), db.func.max(Polar.id)
+        ).where(Polar.boat_id == boat_id)).one()
+        etag = _etag_of('polars', boat_id, *state)
+        not_modified = _not_modified(etag)
+        if not_modified is not None:
+            return not_modified
+
+        # Project only the listed columns: no ORM instances to hydrate
+        # or track for rows we just turn into dicts
+        rows = db.session.execute(
+            db.select(Polar.id, Polar.version, Polar.generation_date,
+                      Polar.data_summary, Polar.file_url)
+            .filter_by(boat_id=boat_id)
+            .order_by(Polar.generation_date.desc())).all()
+
+        polar_list = [{
+            'id': polar_id,
+            'version': version,
+            'generation_date': generation_date.isoformat(),
+            'summary': data_summary or {},
+            'cloud_key': file_url
+        } for polar_id, version, generation_date, data_summary, file_url in rows]
+
+        return _tagged(jsonify({'polars': polar_list}), etag)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Polar files are immutable once written — a regeneration gets a new key
+# and a new version — so cached blobs never go stale and repeat downloads
+# of the same polar skip the S3 GET entirely. Failed downloads raise so
+# a transient miss is never pinned in the cache.
+@lru_cache(maxsize=128)
+def _fetch_polar_blob(key):
+    content = cloud_storage.download_file(key)
+    if content is None:
+        raise LookupError(key)
+    return content
+
+def _send_polar(polar, boat_name):
+    """Serve a polar as a plain-text attachment
+
+    The content used to travel inside a JSON envelope, which meant a
+    UTF-8 decode, a JSON escape pass over the whole blob, and a parse on
+    the client. send_file ships the raw bytes instead; the generation
+    date moves to a response header.
+
+    Because a polar's content never changes, the ETag is just its
+    id-version pair and matching If-None-Match requests get a 304 before
+    any storage access; fresh responses carry a private, immutable
+    Cache-Control so the client doesn't revalidate but shared caches
+    never store this Authorization-gated body.
+    """
+    etag = f"{polar.id}-{polar.version}"
+    if etag in request.if_none_match:
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+
+    polar_bytes = None
+    if polar.file_url:
+        try:
+            polar_bytes = _fetch_polar_blob(polar.file_url)
+        except LookupError:
+            polar_bytes = None
+    if polar_bytes is None and polar.polar_data is not None:
+        polar_bytes = polar.polar_data.encode('utf-8')
+    if polar_bytes is None:
+        return jsonify({'error': 'Polar content not available'}), 404
+
+    response = send_file(
+        io.BytesIO(polar_bytes),
+        mimetype='text/plain',
+        as_attachment=True,
+        download_name=f"{boat_name}_.txt"
+    )
+    response.headers['X-Generation-Date'] = polar.generation_date.isoformat()
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
 @polars_bp.route('/boats/<int:boat_id>/polars/<int:polar_id>/download', methods=['GET'])
 @token_required
 def download_polar(current_user, boat_id, polar_id):
     """Download a specific polar from cloud storage"""
     try:
-        boat = Boat.query.filter_by(id=boat_id, user_id=current_user.id).first()
-        if not boat:
+        boat_name = db.session.scalar(
+            _BOAT_NAME_STMT, {'boat_id': boat_id, 'user_id': current_user.id})
+        if boat_name is None:
             return jsonify({'error': 'Boat not found'}), 404
-        
-        polar = Polar.query.filter_by(id=polar_id, boat_id=boat_id).first()
+
+        # The blob is deferred by default; this endpoint returns it, so
+        # undefer keeps the load to a single roundtrip
+        polar = db.session.scalar(
+            db.select(Polar).filter_by(id=polar_id, boat_id=boat_id)
+            .options(db.undefer(Polar.polar_data)))
         if not polar:
             return jsonify({'error': 'Polar not found'}), 404
         
-        # Try to get from cloud storage first
-        polar_content = polar.polar_data
-        if hasattr(polar, 'file_url') and polar.file_url:
-            cloud_content = cloud_storage.download_file(polar.file_url)
-            if cloud_content:
-                polar_content = cloud_content.decode('utf-8')
-        
-        return jsonify({
-            'polar_content': polar_content,
-            'filename': f"{boat.name}_.txt",
-            'generation_date': polar.generation_date.isoformat()
-        }), 200
-        
+        return _send_polar(polar, boat_name)
+
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -224,27 +321,20 @@ def download_polar(current_user, boat_id, polar_id):
 def download_latest_polar(current_user, boat_id):
     """Download the latest polar for a boat from cloud storage"""
     try:
-        boat = Boat.query.filter_by(id=boat_id, user_id=current_user.id).first()
-        if not boat:
+        boat_name = db.session.scalar(
+            _BOAT_NAME_STMT, {'boat_id': boat_id, 'user_id': current_user.id})
+        if boat_name is None:
             return jsonify({'error': 'Boat not found'}), 404
-        
-        polar = Polar.query.filter_by(boat_id=boat_id).order_by(Polar.generation_date.desc()).first()
+
+        polar = db.session.scalar(
+            db.select(Polar).filter_by(boat_id=boat_id)
+            .options(db.undefer(Polar.polar_data))
+            .order_by(Polar.generation_date.desc()).limit(1))
         if not polar:
             return jsonify({'error': 'No polars found for this boat'}), 404
         
-        # Try to get from cloud storage first
-        polar_content = polar.polar_data
-        if hasattr(polar, 'file_url') and polar.file_url:
-            cloud_content = cloud_storage.download_file(polar.file_url)
-            if cloud_content:
-                polar_content = cloud_content.decode('utf-8')
-        
-        return jsonify({
-            'polar_content': polar_content,
-            'filename': f"{boat.name}_.txt",
-            'generation_date': polar.generation_date.isoformat()
-        }), 200
-        
+        return _send_polar(polar, boat_name)
+
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -253,24 +343,34 @@ def download_latest_polar(current_user, boat_id):
 def get_boat_files(current_user, boat_id):
     """Get all uploaded files for a boat"""
     try:
-        boat = Boat.query.filter_by(id=boat_id, user_id=current_user.id).first()
-        if not boat:
+        if not _owns_boat(current_user.id, boat_id):
             return jsonify({'error': 'Boat not found'}), 404
         
-        log_files = LogFile.query.filter_by(boat_id=boat_id).order_by(LogFile.upload_date.desc()).all()
-        
-        file_list = []
-        for lf in log_files:
-            file_list.append({
-                'id': lf.id,
-                'filename': lf.filename,
-                'size': lf.file_size,
-                'upload_date': lf.upload_date.isoformat(),
-                'status': lf.status,
-                'cloud_key': lf.file_path
-            })
-        
-        return jsonify({'files': file_list}), 200
+        # Same insert-only validator as the boats-blueprint file listing
+        state = db.session.execute(db.select(
+            db.func.count(LogFile.id), db.func.max(LogFile.id)
+        ).where(LogFile.boat_id == boat_id)).one()
+        etag = _etag_of('files', boat_id, *state)
+        not_modified = _not_modified(etag)
+        if not_modified is not None:
+            return not_modified
+
+        rows = db.session.execute(
+            db.select(LogFile.id, LogFile.filename, LogFile.file_size,
+                      LogFile.upload_date, LogFile.processing_status, LogFile.file_path)
+            .filter_by(boat_id=boat_id)
+            .order_by(LogFile.upload_date.desc())).all()
+
+        file_list = [{
+            'id': file_id,
+            'filename': filename,
+            'size': file_size,
+            'upload_date': upload_date.isoformat(),
+            'status': processing_status,
+            'cloud_key': file_path
+        } for file_id, filename, file_size, upload_date, processing_status, file_path in rows]
+
+        return _tagged(jsonify({'files': file_list}), etag)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
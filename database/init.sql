@@ -73,6 +73,11 @@ CREATE INDEX IF NOT EXISTS idx_polars_boat_id ON polars(boat_id);
 CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);
 CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
 
+-- Covering index so boat-list lookups can be satisfied by an
+-- index-only scan instead of touching the heap
+CREATE INDEX IF NOT EXISTS idx_boats_user_id_id_incl ON boats(user_id, id)
+    INCLUDE (name, boat_type, class_design, year_built, created_at, updated_at);
+
 -- Create trigger to update updated_at timestamp
 CREATE OR REPLACE FUNCTION update_updated_at_column()
 RETURNS TRIGGER AS $$